@@ -4,30 +4,120 @@ Handles message processing, connection management, and session persistence.
 """
 
 import asyncio
-import json
 import logging
+import os
 import signal
 import time
-import uuid
-from datetime import datetime, timezone
-from typing import Dict, Optional, Set
+import weakref
+from itertools import islice
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.core.cache import cache
 from django.conf import settings
 
 from .metrics import (
     websocket_connections,
     websocket_messages,
-    websocket_errors,
     websocket_heartbeats,
     websocket_shutdown_duration,
-    track_websocket_duration
+    track_websocket_duration,
+    ERR_CONNECT,
+    ERR_DISCONNECT,
+    ERR_INVALID_JSON,
+    ERR_RECEIVE
 )
 
 logger = logging.getLogger(__name__)
 
+# 16 random bytes hex-encoded; ~10x cheaper than building a uuid.UUID
+# object per connection and just as unique for ids that are only logged.
+_randbytes = os.urandom
+
+# Pre-encoded frames for fixed payloads. Using bytes templates with %-formatting
+# avoids even orjson's dict allocation on the per-message hot path.
+_BYE_TEMPLATE = b'{"bye":true,"total":%d}'
+_COUNT_TEMPLATE = b'{"count":%d}'
+_ERROR_INVALID_JSON = b'{"error":"Invalid JSON"}'
+_ERROR_INTERNAL = b'{"error":"Internal error"}'
+
+# In-process session cache with write-behind flushing. Connects consult this
+# first so reconnect bursts don't issue one Redis GET each; session writes
+# are coalesced in _PENDING_WRITES and flushed in batches by the flush loop.
+_SESSION_CACHE: Dict[str, Tuple[int, float]] = {}  # session_id -> (count, expires_at)
+_SESSION_CACHE_MAX = 50_000
+_PENDING_WRITES: Dict[str, int] = {}
+_SESSION_FLUSH_INTERVAL = 1.0  # seconds
+_session_flush_task: Optional[asyncio.Task] = None
+
+
+def _evict_expired_sessions():
+    """Drop expired entries from the local session cache."""
+    now = time.time()
+    for session_id in [sid for sid, (_, expires_at) in _SESSION_CACHE.items()
+                       if expires_at <= now]:
+        del _SESSION_CACHE[session_id]
+
+
+def _evict_oldest_sessions():
+    """Evict oldest entries (insertion order) to get back under the cap."""
+    excess = len(_SESSION_CACHE) - _SESSION_CACHE_MAX + 1
+    for session_id in list(islice(_SESSION_CACHE, excess)):
+        del _SESSION_CACHE[session_id]
+
+
+def _ensure_session_flush_task():
+    """Start the write-behind flush loop if it isn't running."""
+    global _session_flush_task
+    if _session_flush_task is None or _session_flush_task.done():
+        _session_flush_task = asyncio.create_task(_session_flush_loop())
+
+
+async def _flush_pending_sessions():
+    """Flush coalesced session writes to Redis in a single batch."""
+    if not _PENDING_WRITES:
+        return
+    batch = dict(_PENDING_WRITES)
+    _PENDING_WRITES.clear()
+    try:
+        await _redis_set_sessions(batch)
+    except BaseException:
+        # Requeue the batch (newer writes win) so a transient Redis error -
+        # or a cancellation landing mid-write - doesn't drop up to a second
+        # of session counts. BaseException because CancelledError is not an
+        # Exception on 3.11.
+        for session_id, count in batch.items():
+            _PENDING_WRITES.setdefault(session_id, count)
+        raise
+
+
+async def _session_flush_loop():
+    """Periodically flush pending session writes to Redis."""
+    while True:
+        try:
+            await asyncio.sleep(_SESSION_FLUSH_INTERVAL)
+            await _flush_pending_sessions()
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Session flush error: {e}", exc_info=True)
+
+
+async def _redis_set_sessions(batch: Dict[str, int]):
+    """Write a batch of session counts to Redis."""
+    await cache.aset_many(
+        {f"ws_session:{sid}": count for sid, count in batch.items()},
+        timeout=300  # 5 minute TTL
+    )
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     """
@@ -39,18 +129,47 @@ class ChatConsumer(AsyncWebsocketConsumer):
     - Metrics collection and structured logging
     """
     
-    # Class-level tracking for active connections
-    active_connections: Set['ChatConsumer'] = set()
+    # Class-level tracking for active connections. Weak references: a
+    # consumer whose disconnect never ran (crashed transport, dropped task)
+    # shouldn't be pinned in memory by this registry.
+    active_connections: "weakref.WeakSet[ChatConsumer]" = weakref.WeakSet()
     shutdown_initiated = False
     heartbeat_task: Optional[asyncio.Task] = None
-    
+
+    # Connection counter guarded by a lock so the heartbeat is armed exactly
+    # once on the 0 -> 1 transition even under concurrent connects.
+    _conn_count: int = 0
+    _hb_lock = asyncio.Lock()
+
+    # Channel layer cached once so broadcast paths don't re-resolve it
+    # through Django settings on every use.
+    _channel_layer = None
+
+    # Parallel fan-out registries: broadcast loops iterate the bound send
+    # methods contiguously instead of chasing attributes per consumer object.
+    # Entries are weak (WeakMethod/ref) for the same reason active_connections
+    # is a WeakSet: a consumer whose disconnect never ran must not stay pinned
+    # here. Kept in sync via index-tracked swap-pop, with dead entries pruned
+    # during the heartbeat pass.
+    _send_callables: list = []
+    _fanout_owners: list = []
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.session_id: Optional[str] = None
         self.message_count: int = 0
         self.connection_start: float = 0
-        self.connection_id: str = str(uuid.uuid4())
+        self.connection_id: str = _randbytes(16).hex()
         self.graceful_close: bool = False
+        self._hb_counted: bool = False
+        self._fanout_index: int = -1
+        # Frame codec; swapped for MessagePack if the client negotiates it
+        self._encode = orjson.dumps
+        self._decode = orjson.loads
+        self._uses_msgpack: bool = False
+        # Static log fields built once; per-call fields are merged in only
+        # when a record is actually emitted.
+        self._log_ctx: Dict[str, object] = {"connection_id": self.connection_id}
         
     async def connect(self):
         """Handle WebSocket connection with session recovery."""
@@ -65,44 +184,62 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.connection_start = time.time()
             
             # Extract session ID from query params for reconnection
-            query_params = self.scope.get('query_string', b'').decode()
-            if 'session_uuid=' in query_params:
-                self.session_id = query_params.split('session_uuid=')[1].split('&')[0]
-                
+            query_params = parse_qs(self.scope.get('query_string', b''))
+            session_uuid = query_params.get(b'session_uuid', [None])[0]
+            if session_uuid:
+                self.session_id = session_uuid.decode()
+
                 # Try to recover session from cache
                 cached_count = await self.get_cached_session(self.session_id)
                 if cached_count is not None:
                     self.message_count = cached_count
                     logger.info(f"Recovered session {self.session_id} with count {self.message_count}")
             else:
-                self.session_id = str(uuid.uuid4())
-                
+                # Reuse the connection id rather than generating a second id
+                self.session_id = self.connection_id
+            self._log_ctx["session_id"] = self.session_id
+
+            # Negotiate optional MessagePack subprotocol for smaller control
+            # frames; clients that don't offer it keep JSON.
+            if msgpack is not None and 'msgpack' in self.scope.get('subprotocols', []):
+                self._encode = msgpack.packb
+                self._decode = msgpack.unpackb
+                self._uses_msgpack = True
+
             # Accept connection
-            await self.accept()
+            await self.accept(subprotocol='msgpack' if self._uses_msgpack else None)
             
-            # Add to active connections
+            # Add to active connections and fan-out registries
             self.active_connections.add(self)
+            self._fanout_index = len(self._send_callables)
+            self._send_callables.append(weakref.WeakMethod(self.send))
+            self._fanout_owners.append(weakref.ref(self))
             websocket_connections.inc()
             
             # Join room for broadcasts
+            if ChatConsumer._channel_layer is None:
+                ChatConsumer._channel_layer = self.channel_layer
             await self.channel_layer.group_add("broadcast", self.channel_name)
             
             # Start heartbeat if this is the first connection
-            if len(self.active_connections) == 1 and not self.heartbeat_task:
-                self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+            async with self._hb_lock:
+                ChatConsumer._conn_count += 1
+                self._hb_counted = True
+                if ChatConsumer._conn_count == 1 and ChatConsumer.heartbeat_task is None:
+                    ChatConsumer.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
                 
-            logger.info(
-                f"WebSocket connected",
-                extra={
-                    "connection_id": self.connection_id,
-                    "session_id": self.session_id,
-                    "message_count": self.message_count,
-                    "active_connections": len(self.active_connections)
-                }
-            )
+            if not getattr(settings, 'WEBSOCKET_QUIET', False):
+                logger.info(
+                    "WebSocket connected",
+                    extra={
+                        **self._log_ctx,
+                        "message_count": self.message_count,
+                        "active_connections": len(self.active_connections)
+                    }
+                )
             
         except Exception as e:
-            websocket_errors.labels(error_type="connection_error").inc()
+            ERR_CONNECT.inc()
             logger.error(f"Connection error: {e}", exc_info=True)
             await self.close(code=1011)
             
@@ -111,6 +248,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         try:
             # Remove from active connections
             self.active_connections.discard(self)
+            self._fanout_remove()
             websocket_connections.dec()
             
             # Track connection duration
@@ -128,76 +266,118 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Send goodbye message if not already sent
             if not self.graceful_close and close_code != 1001:
                 try:
-                    await self.send(text_data=json.dumps({
-                        "bye": True,
-                        "total": self.message_count
-                    }))
+                    await self.send(bytes_data=self._bye_payload())
                 except:
                     pass  # Connection might already be closed
                     
-            # Stop heartbeat if this was the last connection
-            if len(self.active_connections) == 0 and self.heartbeat_task:
-                self.heartbeat_task.cancel()
-                self.heartbeat_task = None
+            # Stop heartbeat if this was the last connection. Only counted
+            # consumers decrement: disconnect also fires for connects that
+            # raised or were rejected before the counting block, and those
+            # must not drive the counter negative.
+            async with self._hb_lock:
+                if self._hb_counted:
+                    self._hb_counted = False
+                    ChatConsumer._conn_count -= 1
+                    if ChatConsumer._conn_count == 0 and ChatConsumer.heartbeat_task:
+                        ChatConsumer.heartbeat_task.cancel()
+                        ChatConsumer.heartbeat_task = None
                 
-            logger.info(
-                f"WebSocket disconnected",
-                extra={
-                    "connection_id": self.connection_id,
-                    "session_id": self.session_id,
-                    "close_code": close_code,
-                    "message_count": self.message_count,
-                    "duration": duration if self.connection_start else 0,
-                    "active_connections": len(self.active_connections)
-                }
-            )
+            if not getattr(settings, 'WEBSOCKET_QUIET', False):
+                logger.info(
+                    "WebSocket disconnected",
+                    extra={
+                        **self._log_ctx,
+                        "close_code": close_code,
+                        "message_count": self.message_count,
+                        "duration": duration if self.connection_start else 0,
+                        "active_connections": len(self.active_connections)
+                    }
+                )
             
         except Exception as e:
-            websocket_errors.labels(error_type="disconnect_error").inc()
+            ERR_DISCONNECT.inc()
             logger.error(f"Disconnect error: {e}", exc_info=True)
             
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming WebSocket messages."""
         try:
             # Parse message
-            data = json.loads(text_data)
+            data = self._decode(bytes_data if text_data is None else text_data)
             message = data.get('message', '')
-            
+
             # Increment counter
             self.message_count += 1
             websocket_messages.inc()
-            
+
             # Send response with count
-            await self.send(text_data=json.dumps({
-                "count": self.message_count
-            }))
+            if self._uses_msgpack:
+                await self.send(bytes_data=self._encode({"count": self.message_count}))
+            else:
+                await self.send(bytes_data=_COUNT_TEMPLATE % self.message_count)
             
-            logger.debug(
-                f"Message received",
-                extra={
-                    "connection_id": self.connection_id,
-                    "session_id": self.session_id,
-                    "message_count": self.message_count,
-                    "message_length": len(message)
-                }
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                self._log_ctx["message_count"] = self.message_count
+                logger.debug(
+                    "Message received",
+                    extra={**self._log_ctx, "message_length": len(message)}
+                )
             
-        except json.JSONDecodeError:
-            websocket_errors.labels(error_type="invalid_json").inc()
-            await self.send(text_data=json.dumps({
-                "error": "Invalid JSON"
-            }))
+        except ValueError:
+            ERR_INVALID_JSON.inc()
+            await self.send(bytes_data=self._encode({"error": "Invalid JSON"})
+                            if self._uses_msgpack else _ERROR_INVALID_JSON)
         except Exception as e:
-            websocket_errors.labels(error_type="receive_error").inc()
+            ERR_RECEIVE.inc()
             logger.error(f"Receive error: {e}", exc_info=True)
-            await self.send(text_data=json.dumps({
-                "error": "Internal error"
-            }))
-            
+            await self.send(bytes_data=self._encode({"error": "Internal error"})
+                            if self._uses_msgpack else _ERROR_INTERNAL)
+
+    def _bye_payload(self) -> bytes:
+        """Build the goodbye frame in this connection's negotiated codec."""
+        if self._uses_msgpack:
+            return self._encode({"bye": True, "total": self.message_count})
+        return _BYE_TEMPLATE % self.message_count
+
+    def _fanout_remove(self):
+        """Remove this consumer from the fan-out registries via swap-pop."""
+        idx = self._fanout_index
+        if not 0 <= idx < len(self._send_callables):
+            return
+        last_owner = self._fanout_owners[-1]()
+        self._send_callables[idx] = self._send_callables[-1]
+        self._fanout_owners[idx] = self._fanout_owners[-1]
+        if last_owner is not None:
+            last_owner._fanout_index = idx
+        self._send_callables.pop()
+        self._fanout_owners.pop()
+        self._fanout_index = -1
+
+    @classmethod
+    def _prune_fanout(cls):
+        """Drop registry entries whose consumer was garbage collected."""
+        sends, owners = [], []
+        for send_ref, owner_ref in zip(cls._send_callables, cls._fanout_owners):
+            owner = owner_ref()
+            if owner is None or send_ref() is None:
+                continue
+            owner._fanout_index = len(sends)
+            sends.append(send_ref)
+            owners.append(owner_ref)
+        cls._send_callables[:] = sends
+        cls._fanout_owners[:] = owners
+
     async def broadcast_message(self, event):
-        """Handle broadcast messages from channel layer."""
-        message = event['message']
-        await self.send(text_data=json.dumps(message))
+        """
+        Handle broadcast messages from channel layer.
+
+        Publishers may attach pre-encoded JSON bytes as event['payload'] so a
+        1-to-N broadcast is encoded once instead of once per consumer; the
+        original dict stays in event['message'] for msgpack connections.
+        """
+        payload = event.get('payload')
+        if payload is None or self._uses_msgpack:
+            payload = self._encode(event['message'])
+        await self.send(bytes_data=payload)
         
     @classmethod
     async def heartbeat_loop(cls):
@@ -209,21 +389,54 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 if cls.shutdown_initiated:
                     break
                     
-                timestamp = datetime.now(timezone.utc).isoformat()
+                # Epoch seconds; far cheaper than datetime.isoformat() and
+                # equivalent for clients that treat the value as opaque.
+                timestamp = round(time.time(), 3)
                 websocket_heartbeats.inc()
-                
-                # Broadcast heartbeat to all connections
-                from channels.layers import get_channel_layer
-                channel_layer = get_channel_layer()
-                
-                await channel_layer.group_send(
-                    "broadcast",
-                    {
-                        "type": "broadcast_message",
-                        "message": {"ts": timestamp}
-                    }
-                )
-                
+
+                if getattr(settings, 'WEBSOCKET_HEARTBEAT_LOCAL_ONLY', True):
+                    # Fan out directly to in-process sockets with one shared
+                    # pre-encoded frame - no Redis round-trip per tick.
+                    # One shared frame per codec per tick
+                    payload_json = orjson.dumps({"ts": timestamp})
+                    payload_mp = msgpack.packb({"ts": timestamp}) if msgpack else None
+                    pairs = []
+                    stale = False
+                    for send_ref, owner_ref in zip(cls._send_callables, cls._fanout_owners):
+                        send, owner = send_ref(), owner_ref()
+                        if send is None or owner is None:
+                            stale = True
+                            continue
+                        pairs.append((send, owner))
+                    if stale:
+                        cls._prune_fanout()
+                    await asyncio.gather(
+                        *(send(bytes_data=payload_mp if owner._uses_msgpack else payload_json)
+                          for send, owner in pairs),
+                        return_exceptions=True
+                    )
+                else:
+                    # Cross-process broadcast via the channel layer. Elect a
+                    # single publisher per tick with a SETNX-style cache lock
+                    # so W workers don't send W duplicate frames per client;
+                    # the TTL sits under the interval so the lock is free
+                    # again by the next tick even if the holder dies.
+                    if not await cache.aadd("ws_heartbeat_lock", 1, timeout=25):
+                        continue
+
+                    if cls._channel_layer is None:
+                        from channels.layers import get_channel_layer
+                        cls._channel_layer = get_channel_layer()
+
+                    await cls._channel_layer.group_send(
+                        "broadcast",
+                        {
+                            "type": "broadcast_message",
+                            "message": {"ts": timestamp},
+                            "payload": orjson.dumps({"ts": timestamp})
+                        }
+                    )
+
                 logger.debug(f"Heartbeat sent to {len(cls.active_connections)} connections")
                 
             except asyncio.CancelledError:
@@ -243,46 +456,92 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if cls.heartbeat_task:
             cls.heartbeat_task.cancel()
             
-        # Close all active connections with code 1001
-        tasks = []
-        for consumer in list(cls.active_connections):
+        # Close all active connections with code 1001; goodbye and close
+        # run as one coroutine per socket so each connection costs a single
+        # event-loop scheduling instead of two.
+        # Bound fan-out parallelism: scheduling every close at once
+        # saturates the event loop at thousands of sockets, so keep at
+        # most 256 goodbye/close pairs in flight.
+        semaphore = asyncio.Semaphore(256)
+
+        async def _bye_and_close(consumer, payload):
+            async with semaphore:
+                try:
+                    await consumer.send(bytes_data=payload)
+                except:
+                    pass
+                try:
+                    await consumer.close(code=1001)
+                except:
+                    pass
+
+        consumers = [c for c in (ref() for ref in cls._fanout_owners) if c is not None]
+        for consumer in consumers:
             consumer.graceful_close = True
+
+        # Goodbye frames keep the per-connection total (it's part of the
+        # client protocol), so they can't be a single shared bytes object;
+        # pre-format them all from the template up front so the gathered
+        # coroutines only write to sockets.
+        payloads = [c._bye_payload() for c in consumers]
+
+        # Wait for all connections to close (max 10 seconds)
+        if consumers:
+            async def _close_all():
+                async with asyncio.TaskGroup() as tg:
+                    for consumer, payload in zip(consumers, payloads):
+                        tg.create_task(_bye_and_close(consumer, payload))
+
+            try:
+                await asyncio.wait_for(_close_all(), timeout=9.0)  # Leave 1 second buffer
+            except asyncio.TimeoutError:
+                logger.warning("Graceful shutdown timed out before all connections closed")
             
-            # Send goodbye message
+        # Flush any coalesced session writes so reconnect counts survive.
+        # Await the cancelled loop first: a flush mid-write requeues its
+        # batch on cancellation, and the final flush below picks it up.
+        if _session_flush_task:
+            _session_flush_task.cancel()
             try:
-                await consumer.send(text_data=json.dumps({
-                    "bye": True,
-                    "total": consumer.message_count
-                }))
-            except:
+                await _session_flush_task
+            except asyncio.CancelledError:
                 pass
-                
-            # Close connection
-            tasks.append(consumer.close(code=1001))
-            
-        # Wait for all connections to close (max 10 seconds)
-        if tasks:
-            await asyncio.wait_for(
-                asyncio.gather(*tasks, return_exceptions=True),
-                timeout=9.0  # Leave 1 second buffer
-            )
-            
+        try:
+            await _flush_pending_sessions()
+        except Exception as e:
+            logger.error(f"Final session flush error: {e}", exc_info=True)
+
         shutdown_duration = time.time() - shutdown_start
         websocket_shutdown_duration.observe(shutdown_duration)
         
         logger.info(f"Graceful shutdown completed in {shutdown_duration:.2f} seconds")
         
-    @database_sync_to_async
-    def get_cached_session(self, session_id: str) -> Optional[int]:
-        """Retrieve session from cache."""
-        key = f"ws_session:{session_id}"
-        return cache.get(key)
-        
-    @database_sync_to_async
-    def cache_session(self, session_id: str, count: int):
-        """Cache session for reconnection."""
-        key = f"ws_session:{session_id}"
-        cache.set(key, count, timeout=300)  # 5 minute TTL
+    async def get_cached_session(self, session_id: str) -> Optional[int]:
+        """Retrieve session from the local cache, falling back to Redis."""
+        entry = _SESSION_CACHE.get(session_id)
+        if entry is not None:
+            count, expires_at = entry
+            if expires_at > time.time():
+                return count
+            del _SESSION_CACHE[session_id]
+        return await cache.aget(f"ws_session:{session_id}")
+
+    async def cache_session(self, session_id: str, count: int):
+        """Cache session for reconnection; the Redis write is deferred."""
+        if len(_SESSION_CACHE) >= _SESSION_CACHE_MAX:
+            _evict_expired_sessions()
+            if len(_SESSION_CACHE) >= _SESSION_CACHE_MAX:
+                # Nothing expired: drop the oldest entries so the cap holds
+                _evict_oldest_sessions()
+        _SESSION_CACHE[session_id] = (count, time.time() + 300)  # 5 minute TTL
+        if ChatConsumer.shutdown_initiated:
+            # Shutdown-driven disconnects land after the final flush has run
+            # and the flush loop is torn down; write through so the count
+            # still reaches Redis before the process exits.
+            await _redis_set_sessions({session_id: count})
+            return
+        _PENDING_WRITES[session_id] = count
+        _ensure_session_flush_task()
 
 
 # Signal handler for graceful shutdown
@@ -3,6 +3,8 @@ Prometheus metrics configuration for WebSocket monitoring.
 Tracks connections, messages, errors, and performance metrics.
 """
 
+from functools import lru_cache
+
 from prometheus_client import Counter, Gauge, Histogram, Summary
 from prometheus_client.core import CollectorRegistry
 from prometheus_client.multiprocess import MultiProcessCollector
@@ -46,6 +48,13 @@ websocket_errors = Counter(
     registry=registry
 )
 
+# Pre-bound error counters so hot paths call .inc() directly instead of
+# going through the .labels() tuple build and child lookup every time
+ERR_CONNECT = websocket_errors.labels(error_type="connection_error")
+ERR_DISCONNECT = websocket_errors.labels(error_type="disconnect_error")
+ERR_INVALID_JSON = websocket_errors.labels(error_type="invalid_json")
+ERR_RECEIVE = websocket_errors.labels(error_type="receive_error")
+
 # Performance metrics
 websocket_message_duration = Histogram(
     'websocket_message_duration_seconds',
@@ -160,10 +169,20 @@ def track_message_size(size: int):
     websocket_message_size.observe(size)
 
 
+@lru_cache(maxsize=256)
+def _request_metrics(method: str, endpoint: str, status: str):
+    """Cache label-bound request metrics per (method, endpoint, status)."""
+    return (
+        django_requests.labels(method=method, endpoint=endpoint, status=status),
+        django_request_duration.labels(method=method, endpoint=endpoint),
+    )
+
+
 def track_request(method: str, endpoint: str, status: int, duration: float):
     """Track Django HTTP request."""
-    django_requests.labels(method=method, endpoint=endpoint, status=str(status)).inc()
-    django_request_duration.labels(method=method, endpoint=endpoint).observe(duration)
+    counter, histogram = _request_metrics(method, endpoint, str(status))
+    counter.inc()
+    histogram.observe(duration)
 
 
 # Metrics view for /metrics endpoint
@@ -179,22 +198,27 @@ def metrics_view(request):
 
 # Middleware for automatic request tracking
 import time
-from django.utils.deprecation import MiddlewareMixin
-
-
-class PrometheusMiddleware(MiddlewareMixin):
-    """Middleware to track Django requests automatically."""
-    
-    def process_request(self, request):
-        request._prometheus_start_time = time.time()
-        
-    def process_response(self, request, response):
-        if hasattr(request, '_prometheus_start_time'):
-            duration = time.time() - request._prometheus_start_time
-            track_request(
-                method=request.method,
-                endpoint=request.path,
-                status=response.status_code,
-                duration=duration
-            )
+
+
+class PrometheusMiddleware:
+    """Async middleware to track Django requests automatically."""
+
+    sync_capable = False
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    async def __call__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        # Label by route template rather than raw path so variable segments
+        # (e.g. /user/123) don't mint a new metric series per URL
+        route = getattr(request.resolver_match, 'route', None) or '__unmatched__'
+        track_request(
+            method=request.method,
+            endpoint=route,
+            status=response.status_code,
+            duration=time.perf_counter() - start
+        )
         return response
@@ -5,6 +5,16 @@ Configures Channels with proper routing and middleware.
 
 import os
 import django
+
+# Use uvloop's libuv-based event loop when available; it roughly doubles
+# throughput for many-small-sends WebSocket workloads. install() sets the
+# policy so uvicorn picks it up without needing --loop uvloop.
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
@@ -7,6 +7,7 @@ import os
 import sys
 from pathlib import Path
 import dj_database_url
+import orjson
 import structlog
 
 # Build paths
@@ -79,13 +80,31 @@ DATABASES = {
 # ASGI Configuration for Channels
 ASGI_APPLICATION = 'config.asgi.application'
 
+# Redis protocol parsing drops to C when hiredis is installed; both the
+# channel layer and the cache client pick it up automatically via redis-py.
+try:
+    import hiredis  # noqa: F401
+    HIREDIS_AVAILABLE = True
+except ImportError:
+    HIREDIS_AVAILABLE = False
+    import warnings
+    warnings.warn('hiredis not installed; falling back to pure-Python RESP parsing')
+
+# Single Redis endpoint shared by the channel layer and the cache. The two
+# clients cannot literally share one pool (the cache client is sync, the
+# channel layer is asyncio), so instead their pool sizes are budgeted
+# together here to cap total sockets against Redis per worker.
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_CACHE_MAX_CONNECTIONS = int(os.environ.get('REDIS_CACHE_MAX_CONNECTIONS', '100'))
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))],
-            "capacity": 1500,  # Maximum messages per channel
+            "hosts": [REDIS_URL],
+            "capacity": 500,  # Maximum messages per channel; caps buffered memory
             "expiry": 10,  # Message expiry time
+            "prefix": "asgi:",  # Key namespace shared with other workers
         },
     },
 }
@@ -94,15 +113,11 @@ CHANNEL_LAYERS = {
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-        'LOCATION': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+        'LOCATION': REDIS_URL,
         'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-            'PARSER_CLASS': 'redis.connection.HiredisParser',
-            'CONNECTION_POOL_CLASS': 'redis.BlockingConnectionPool',
-            'CONNECTION_POOL_CLASS_KWARGS': {
-                'max_connections': 50,
-                'timeout': 20,
-            },
+            'pool_class': 'redis.BlockingConnectionPool',
+            'max_connections': REDIS_CACHE_MAX_CONNECTIONS,
+            'timeout': 20,
         },
     }
 }
@@ -153,13 +168,22 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 # Logging configuration with structured logging
+def _orjson_renderer(logger, name, event_dict):
+    """structlog JSON renderer backed by orjson's C encoder.
+
+    default=repr mirrors JSONRenderer's fallback so records carrying
+    non-primitive fields (exceptions, UUIDs, Paths) still render.
+    """
+    return orjson.dumps(event_dict, default=repr).decode()
+
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
         'json': {
             '()': structlog.stdlib.ProcessorFormatter,
-            'processor': structlog.processors.JSONRenderer(),
+            'processor': _orjson_renderer,
         },
         'console': {
             '()': structlog.stdlib.ProcessorFormatter,
@@ -213,7 +237,7 @@ structlog.configure(
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
         structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer() if not DEBUG else structlog.dev.ConsoleRenderer()
+        _orjson_renderer if not DEBUG else structlog.dev.ConsoleRenderer()
     ],
     context_class=dict,
     logger_factory=structlog.stdlib.LoggerFactory(),
@@ -232,6 +256,14 @@ SESSION_CACHE_ALIAS = 'default'
 WEBSOCKET_MAX_CONNECTIONS = int(os.environ.get('WEBSOCKET_MAX_CONNECTIONS', '5000'))
 WEBSOCKET_HEARTBEAT_INTERVAL = 30  # seconds
 WEBSOCKET_RECONNECTION_TTL = 300  # seconds (5 minutes)
+# Send heartbeats directly to in-process sockets instead of through the
+# channel layer. Correct in any topology - each worker covers exactly its
+# own sockets - and skips the Redis round-trip per tick. The channel-layer
+# fallback elects one publisher per tick via a cache lock; only disable
+# local-only if heartbeats must flow through the broadcast group.
+WEBSOCKET_HEARTBEAT_LOCAL_ONLY = os.environ.get('WEBSOCKET_HEARTBEAT_LOCAL_ONLY', 'True').lower() == 'true'
+# Suppress per-connection INFO logs on the connect/disconnect paths
+WEBSOCKET_QUIET = os.environ.get('WEBSOCKET_QUIET', 'False').lower() == 'true'
 
 # Prometheus multiprocess mode
 PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')